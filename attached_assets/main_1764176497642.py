@@ -1,10 +1,17 @@
 from flask import Flask, request, render_template, url_for, jsonify
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection as PgConnection
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 from flask_cors import CORS
-from datetime import date, datetime
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from functools import wraps
 import math
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 # ==============================================================================
@@ -108,105 +115,519 @@ DB_CONFIG = {
     "port": int(os.getenv('DB_PORT', 5432))
 }
 
+DB_POOL_CONFIG = {
+    'min_conexoes': int(os.getenv('DB_POOL_MIN', 1)),
+    'max_conexoes': int(os.getenv('DB_POOL_MAX', 10)),
+    # Tempo máximo de espera por uma conexão livre antes de desistir
+    'timeout_checkout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    # Conexões ociosas há mais tempo que isso são testadas (SELECT 1) antes do uso
+    'validar_apos_segundos': float(os.getenv('DB_POOL_VALIDAR_APOS', 30)),
+    # Desative (DB_PREPARED_STATEMENTS=false) para comparar com a execução ad-hoc em benchmarks
+    'consultas_preparadas': os.getenv('DB_PREPARED_STATEMENTS', 'true').lower() in ('1', 'true', 'sim')
+}
+
+RATE_LIMIT_CONFIG = {
+    'requisicoes_por_segundo': float(os.getenv('RATE_LIMIT_RPS', 5)),
+    'rajada': int(os.getenv('RATE_LIMIT_BURST', 20)),
+    'max_clientes': int(os.getenv('RATE_LIMIT_MAX_CLIENTS', 10000)),
+    # Chaves de API reconhecidas (cada uma com seu próprio limite) e proxies cujo X-Forwarded-For é confiável
+    'api_keys': {chave.strip() for chave in os.getenv('RATE_LIMIT_API_KEYS', '').split(',') if chave.strip()},
+    'proxies_confiaveis': {ip.strip() for ip in os.getenv('TRUSTED_PROXIES', '').split(',') if ip.strip()}
+}
+
+GIRO_CONFIG = {
+    'janela_dias': int(os.getenv('GIRO_JANELA_DIAS', 30)),
+    'intervalo_atualizacao': int(os.getenv('GIRO_INTERVALO_SEGUNDOS', 300)),
+    'atualizacao_automatica': os.getenv('GIRO_ATUALIZACAO_AUTOMATICA', 'true').lower() in ('1', 'true', 'sim'),
+    'prazo_reposicao_dias': int(os.getenv('GIRO_PRAZO_REPOSICAO_DIAS', 7)),
+    'dias_cobertura_alvo': int(os.getenv('GIRO_DIAS_COBERTURA_ALVO', 15))
+}
+
+
+# ==============================================================================
+# 3. CONTROLE DE CARGA (RATE LIMIT E COALESCÊNCIA DE BUSCAS)
+# ==============================================================================
+
+METRICAS = {
+    'buscas_executadas': 0,
+    'buscas_coalescidas': 0,
+    'requisicoes_permitidas': 0,
+    'requisicoes_limitadas': 0
+}
+_metricas_lock = threading.Lock()
+
+
+def _incrementar_metrica(nome, quantidade=1):
+    """Incrementa um contador de METRICAS de forma thread-safe."""
+    with _metricas_lock:
+        METRICAS[nome] += quantidade
+
+
+class TokenBucket:
+    """Balde de fichas: repõe `taxa` fichas por segundo até `capacidade`."""
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.fichas = float(capacidade)
+        self.atualizado_em = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consumir(self):
+        """Tenta consumir uma ficha. Retorna (permitido, fichas_restantes, segundos_para_nova_ficha)."""
+        with self.lock:
+            agora = time.monotonic()
+            self.fichas = min(self.capacidade, self.fichas + (agora - self.atualizado_em) * self.taxa)
+            self.atualizado_em = agora
+
+            if self.fichas >= 1:
+                self.fichas -= 1
+                return True, int(self.fichas), 0
+
+            espera = (1 - self.fichas) / self.taxa if self.taxa > 0 else 60
+            return False, 0, math.ceil(espera)
+
+
+# Baldes por cliente em ordem de uso (LRU), limitados a RATE_LIMIT_MAX_CLIENTS
+_baldes_clientes = OrderedDict()
+_baldes_lock = threading.Lock()
+
+
+def _ip_cliente():
+    """
+    IP de origem da requisição. O X-Forwarded-For só é considerado quando a conexão vem
+    de um proxy confiável; nesse caso usa o último salto que não é um proxy confiável.
+    """
+    ip = request.remote_addr
+    if ip not in RATE_LIMIT_CONFIG['proxies_confiaveis']:
+        return ip
+
+    saltos = [salto.strip() for salto in request.headers.get('X-Forwarded-For', '').split(',') if salto.strip()]
+    for salto in reversed(saltos):
+        if salto not in RATE_LIMIT_CONFIG['proxies_confiaveis']:
+            return salto
+    return saltos[0] if saltos else ip
+
+
+def _identificar_cliente():
+    """Identifica o cliente pela chave de API cadastrada ou, na falta dela, pelo IP de origem."""
+    api_key = request.headers.get('X-API-Key')
+    if api_key and api_key in RATE_LIMIT_CONFIG['api_keys']:
+        return f"key:{api_key}"
+
+    return f"ip:{_ip_cliente()}"
+
+
+def _obter_balde(cliente):
+    """Retorna o balde do cliente, criando-o (e descartando o menos usado) se necessário."""
+    with _baldes_lock:
+        balde = _baldes_clientes.get(cliente)
+        if balde is not None:
+            _baldes_clientes.move_to_end(cliente)
+            return balde
+
+        while _baldes_clientes and len(_baldes_clientes) >= RATE_LIMIT_CONFIG['max_clientes']:
+            _baldes_clientes.popitem(last=False)
+
+        balde = TokenBucket(RATE_LIMIT_CONFIG['requisicoes_por_segundo'], RATE_LIMIT_CONFIG['rajada'])
+        _baldes_clientes[cliente] = balde
+        return balde
+
+
+def rate_limited(view):
+    """Decorator que aplica o limite de requisições por cliente, respondendo 429 quando excedido."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        permitido, restantes, retry_after = _obter_balde(_identificar_cliente()).consumir()
+
+        if not permitido:
+            _incrementar_metrica('requisicoes_limitadas')
+            response = jsonify({
+                "success": False,
+                "error": "Limite de requisições excedido. Tente novamente em instantes.",
+                "retry_after": retry_after
+            })
+            response.status_code = 429
+            response.headers['Retry-After'] = str(retry_after)
+            response.headers['X-RateLimit-Limit'] = str(RATE_LIMIT_CONFIG['rajada'])
+            response.headers['X-RateLimit-Remaining'] = '0'
+            return response
+
+        _incrementar_metrica('requisicoes_permitidas')
+        response = app.make_response(view(*args, **kwargs))
+        response.headers['X-RateLimit-Limit'] = str(RATE_LIMIT_CONFIG['rajada'])
+        response.headers['X-RateLimit-Remaining'] = str(restantes)
+        return response
+
+    return wrapper
+
+
+class _BuscaEmAndamento:
+    """Resultado compartilhado de uma busca em execução."""
+
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resultado = None
+
+
+_buscas_em_andamento = {}
+_buscas_lock = threading.Lock()
+
+
+def _single_flight(chave, funcao):
+    """
+    Executa `funcao` uma única vez por chave: chamadas concorrentes com a mesma chave
+    aguardam e recebem o mesmo resultado (que não deve ser modificado pelos chamadores).
+    """
+    with _buscas_lock:
+        busca = _buscas_em_andamento.get(chave)
+        lider = busca is None
+        if lider:
+            busca = _BuscaEmAndamento()
+            _buscas_em_andamento[chave] = busca
+
+    if not lider:
+        _incrementar_metrica('buscas_coalescidas')
+        busca.concluida.wait()
+        return busca.resultado
+
+    try:
+        busca.resultado = funcao()
+    finally:
+        with _buscas_lock:
+            del _buscas_em_andamento[chave]
+        busca.concluida.set()
+
+    return busca.resultado
+
+
+# ==============================================================================
+# 4. ACESSO AO BANCO (POOL DE CONEXÕES E CONSULTAS PREPARADAS)
+# ==============================================================================
+
+class ConexaoPreparada(PgConnection):
+    """Conexão que guarda quais consultas do registro já foram preparadas nela."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.consultas_preparadas = set()
+        self.ultimo_uso = time.monotonic()
+
+
+_pool_conexoes = None
+_pool_lock = threading.Lock()
+# O ThreadedConnectionPool falha na hora quando está vazio; o semáforo faz a requisição esperar
+_pool_vagas = threading.BoundedSemaphore(DB_POOL_CONFIG['max_conexoes'])
+
+
+def _obter_pool():
+    """Cria o pool de conexões na primeira utilização."""
+    global _pool_conexoes
+    if _pool_conexoes is None:
+        with _pool_lock:
+            if _pool_conexoes is None:
+                _pool_conexoes = ThreadedConnectionPool(DB_POOL_CONFIG['min_conexoes'],
+                                                        DB_POOL_CONFIG['max_conexoes'],
+                                                        connection_factory=ConexaoPreparada,
+                                                        **DB_CONFIG)
+    return _pool_conexoes
+
+
+def _conexao_utilizavel(conn):
+    """Verifica se a conexão do pool ainda está aberta, sem transação pendente e (se ociosa há muito) responde."""
+    if conn.closed or conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+        return False
+
+    if time.monotonic() - conn.ultimo_uso < DB_POOL_CONFIG['validar_apos_segundos']:
+        return True
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _emprestar_conexao(pool):
+    """Retira do pool uma conexão utilizável, descartando as que caíram (ex.: reinício do servidor)."""
+    for _ in range(DB_POOL_CONFIG['max_conexoes']):
+        conn = pool.getconn()
+        if _conexao_utilizavel(conn):
+            return conn
+        pool.putconn(conn, close=True)
+
+    # Todas as conexões testadas estavam inválidas; o pool abre uma nova
+    return pool.getconn()
+
+
+@contextmanager
+def conexao_db():
+    """
+    Empresta uma conexão do pool, encerrando a transação (commit/rollback) ao final.
+    Quando todas estão em uso, aguarda até `timeout_checkout` segundos por uma livre.
+    """
+    pool = _obter_pool()
+    if not _pool_vagas.acquire(timeout=DB_POOL_CONFIG['timeout_checkout']):
+        raise PoolError("Tempo esgotado aguardando uma conexão livre no pool.")
+
+    try:
+        conn = _emprestar_conexao(pool)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.ultimo_uso = time.monotonic()
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        _pool_vagas.release()
+
+
+class Consulta:
+    """Consulta fixa registrada, com as variantes ad-hoc, PREPARE e EXECUTE."""
+
+    def __init__(self, nome, texto):
+        self.nome = nome
+        self.texto = texto
+        self.num_parametros = texto.count('%s')
+
+        texto_sem_ponto_virgula = texto.strip().rstrip(';')
+        partes = texto_sem_ponto_virgula.split('%s')
+        texto_posicional = partes[0] + ''.join(f"${i}{parte}" for i, parte in enumerate(partes[1:], start=1))
+
+        self.sql_adhoc = sql.SQL(texto)
+        self.sql_prepare = sql.SQL("PREPARE {} AS ").format(sql.Identifier(nome)) + sql.SQL(texto_posicional)
+        if self.num_parametros:
+            self.sql_execute = sql.SQL("EXECUTE {} ({})").format(
+                sql.Identifier(nome), sql.SQL(', ').join([sql.Placeholder()] * self.num_parametros))
+        else:
+            self.sql_execute = sql.SQL("EXECUTE {}").format(sql.Identifier(nome))
+
+
+CONSULTAS = {}
+ESTATISTICAS_CONSULTAS = {}
+_estatisticas_lock = threading.Lock()
+
+
+def registrar_consulta(nome, texto):
+    """Registra uma consulta fixa pelo nome e a retorna para uso com executar_consulta."""
+    if nome in CONSULTAS:
+        raise ValueError(f"Consulta '{nome}' já registrada.")
+    consulta = Consulta(nome, texto)
+    CONSULTAS[nome] = consulta
+    return consulta
+
+
+def _registrar_estatistica(consulta, modo, duracao, preparou):
+    """Acumula contagem e tempos de execução por consulta e modo (preparada/adhoc)."""
+    duracao_ms = duracao * 1000
+    with _estatisticas_lock:
+        estatistica = ESTATISTICAS_CONSULTAS.setdefault((consulta.nome, modo), {
+            'execucoes': 0,
+            'preparos': 0,
+            'tempo_total_ms': 0.0,
+            'tempo_max_ms': 0.0
+        })
+        estatistica['execucoes'] += 1
+        estatistica['preparos'] += 1 if preparou else 0
+        estatistica['tempo_total_ms'] += duracao_ms
+        estatistica['tempo_max_ms'] = max(estatistica['tempo_max_ms'], duracao_ms)
+
+
+def executar_consulta(cur, consulta, params=()):
+    """
+    Executa uma consulta registrada. Com consultas preparadas ativas, faz o PREPARE
+    uma única vez por conexão do pool e reutiliza o plano via EXECUTE.
+    """
+    inicio = time.perf_counter()
+    preparou = False
+
+    if DB_POOL_CONFIG['consultas_preparadas']:
+        modo = 'preparada'
+        preparadas = getattr(cur.connection, 'consultas_preparadas', None)
+        if preparadas is None:
+            # Conexão fora do pool (sem controle do que já foi preparado)
+            modo = 'adhoc'
+            cur.execute(consulta.sql_adhoc, params)
+        else:
+            if consulta.nome not in preparadas:
+                cur.execute(consulta.sql_prepare)
+                preparadas.add(consulta.nome)
+                preparou = True
+            cur.execute(consulta.sql_execute, params)
+    else:
+        modo = 'adhoc'
+        cur.execute(consulta.sql_adhoc, params)
+
+    _registrar_estatistica(consulta, modo, time.perf_counter() - inicio, preparou)
+
+
+def definir_consultas_preparadas(ativo):
+    """Liga/desliga o uso de consultas preparadas (para comparações em benchmarks)."""
+    DB_POOL_CONFIG['consultas_preparadas'] = bool(ativo)
+
+
+def zerar_estatisticas_consultas():
+    """Descarta as estatísticas acumuladas das consultas."""
+    with _estatisticas_lock:
+        ESTATISTICAS_CONSULTAS.clear()
+
+
+def resumo_estatisticas_consultas():
+    """Retorna as estatísticas das consultas em formato serializável."""
+    with _estatisticas_lock:
+        itens = sorted(ESTATISTICAS_CONSULTAS.items())
+        return [{
+            'consulta': nome,
+            'modo': modo,
+            'execucoes': estatistica['execucoes'],
+            'preparos': estatistica['preparos'],
+            'tempo_total_ms': round(estatistica['tempo_total_ms'], 3),
+            'tempo_medio_ms': round(estatistica['tempo_total_ms'] / estatistica['execucoes'], 3),
+            'tempo_max_ms': round(estatistica['tempo_max_ms'], 3)
+        } for (nome, modo), estatistica in itens]
+
+
+# Consultas fixas da aplicação
+
+SQL_BUSCA_DESCRICAO = registrar_consulta('busca_descricao', """
+    SELECT
+        t1.cod_reduzido,
+        t1.nom_produto,
+        t4.vlr_liquido,
+        t3.qtd_estoque,
+        t5.nom_laborat,
+        t1.vlr_venda
+    FROM cadprodu t1
+    LEFT JOIN cadestoq t3 ON t1.cod_reduzido = t3.cod_reduzido
+        AND t3.cod_rede = t1.cod_rede
+        AND t3.cod_filial = %s
+    LEFT JOIN desconto_produto_vw AS t4 ON t4.cod_reduzido = t1.cod_reduzido
+    LEFT JOIN public.cadlabor t5 ON t1.cod_laborat = t5.cod_laborat
+    WHERE t1.nom_produto ILIKE %s AND t1.cod_rede = %s
+    ORDER BY
+        CASE WHEN t3.qtd_estoque > 0 THEN 0 ELSE 1 END,
+        t1.nom_produto
+    LIMIT 10;
+""")
+
+SQL_BUSCA_EAN = registrar_consulta('busca_ean', """
+    SELECT cod_reduzido, cod_barra
+    FROM cadcdbar
+    WHERE cod_barra = %s
+    LIMIT 1;
+""")
+
+SQL_BUSCA_REDUZIDO = registrar_consulta('busca_reduzido', """
+    SELECT t1.cod_reduzido, t2.cod_barra
+    FROM cadprodu t1
+    LEFT JOIN cadcdbar t2 ON t1.cod_reduzido = t2.cod_reduzido
+    WHERE t1.cod_reduzido = %s AND t1.cod_rede = %s
+    LIMIT 1;
+""")
+
+SQL_PRODUTO_FULL = registrar_consulta('produto_full', """
+    SELECT
+        t2.nom_local, t2.vlr_venda, t2.nom_produto,
+        t3.qtd_estoque, t3.est_minimo, t4.vlr_liquido,
+        t5.nom_laborat
+    FROM cadprodu t2
+    LEFT JOIN cadestoq t3 ON t2.cod_reduzido = t3.cod_reduzido AND t3.cod_rede = %s AND t3.cod_filial = %s
+    LEFT JOIN desconto_produto_vw AS t4 ON t4.cod_reduzido = t2.cod_reduzido
+    LEFT JOIN public.cadlabor t5 ON t2.cod_laborat = t5.cod_laborat
+    WHERE t2.cod_reduzido = %s AND t2.cod_rede = %s
+""")
+
+SQL_ULTIMA_VENDA = registrar_consulta('ultima_venda', """
+    SELECT dat_atualiza
+    FROM cadinfis
+    WHERE cod_reduzido = %s AND cod_rede = %s AND cod_filial = %s
+    ORDER BY dat_atualiza DESC
+    LIMIT 1
+""")
+
+SQL_LOTES_ENTRADAS = registrar_consulta('lotes_entradas', """
+    SELECT
+        t1.dat_entrada, t1.qtd_produto, t2.num_lote, t3.dat_fabric,
+        t3.dat_valid, t3.qtd_saldo, t1.cod_fornec, t1.num_nota,
+        t4.nom_fornec
+    FROM public.cadicomp t1
+    INNER JOIN public.cadlentd t2 ON t2.cod_reduzido = t1.cod_reduzido
+        AND t2.num_nota = t1.num_nota
+        AND t2.cod_rede = t1.cod_rede
+        AND t2.cod_filial = t1.cod_filial
+    LEFT JOIN public.cadloted t3 ON t3.num_lote = t2.num_lote
+    LEFT JOIN public.cadforne t4 ON t4.cod_fornec = t1.cod_fornec AND t4.cod_rede = t1.cod_rede
+    WHERE t1.cod_reduzido = %s AND t1.cod_rede = %s AND t1.cod_filial = %s
+    ORDER BY t1.dat_entrada DESC, t1.num_nota DESC, t1.cod_fornec DESC
+    LIMIT 3;
+""")
+
+SQL_ULTIMAS_VENDAS = registrar_consulta('ultimas_vendas', """
+    SELECT
+        t1.dat_atualiza, t1.qtd_produto, (t1.vlr_total / t1.qtd_produto) AS vlr_unitario_final,
+        STRING_AGG(t6.num_lote || ' (' || t6.qtd_lote || ')', ', ') AS lotes_vendidos,
+        t3.nom_usuario, t4.nom_cliente, t1.num_nota, t1.num_sequencial
+    FROM cadinfis t1
+    INNER JOIN public.cadcnfis t2 ON t2.num_nota = t1.num_nota
+        AND t2.cod_rede = t1.cod_rede AND t2.cod_filial = t1.cod_filial
+    LEFT JOIN public.cadcvend t5 ON t5.cod_rede = t2.cod_rede
+        AND t5.cod_filial = t2.cod_filial AND t5.num_nota = t2.num_controle
+    LEFT JOIN public.cadusuar t3 ON t3.cod_usuario = t5.cod_vendedor
+    LEFT JOIN public.cadclien t4 ON t4.cod_cliente = t2.cod_cliente
+    LEFT JOIN public.cadlvend t6 ON t6.cod_rede = t1.cod_rede
+        AND t6.cod_filial = t1.cod_filial AND t6.num_nota = t2.num_controle
+        AND t6.num_seqcadivend = t1.num_sequencial
+    WHERE t1.cod_reduzido = %s AND t1.cod_rede = %s AND t1.cod_filial = %s
+    GROUP BY 1, 2, 3, 5, 6, 7, 8
+    ORDER BY t1.dat_atualiza DESC, t1.num_nota DESC, t1.num_sequencial DESC
+    LIMIT 3
+""")
+
+SQL_NF_FORNEC = registrar_consulta('nf_fornec', """
+    SELECT t2.nom_fornec, t2.num_cnpj, t1.dat_emissao, t1.nom_chavenfe
+    FROM public.cadccomp t1
+    INNER JOIN public.cadforne t2 ON t1.cod_fornec = t2.cod_fornec AND t1.cod_rede = t2.cod_rede
+    WHERE t1.num_nota = %s AND t1.cod_fornec = %s AND t1.cod_rede = %s AND t1.cod_filial = %s
+    ORDER BY t1.dat_emissao DESC
+    LIMIT 1;
+""")
+
 
 # ==============================================================================
-# 3. FUNÇÃO DE BUSCA DE OPÇÕES (REUTILIZÁVEL)
+# 5. FUNÇÃO DE BUSCA DE OPÇÕES (REUTILIZÁVEL)
 # ==============================================================================
 
-def _fetch_product_options(search_term, cod_rede, cod_filial):
-    """Busca múltiplos produtos por descrição."""
+def _fetch_product_options(search_term, cod_rede, cod_filial, cur=None):
+    """
+    Busca múltiplos produtos por descrição, compartilhando buscas idênticas simultâneas.
+    Se `cur` for informado, a busca roda nele em vez de emprestar outra conexão do pool.
+    """
     if not search_term or search_term.isdigit():
         return None
 
+    # Quem já segura uma conexão não pode esperar outra busca: o líder pode precisar dessa vaga do pool
+    if cur is not None:
+        return _query_product_options(search_term, cod_rede, cod_filial, cur)
+
+    # ILIKE não diferencia maiúsculas, então "Dipirona" e "dipirona" compartilham a consulta
+    chave = (search_term.lower(), cod_rede, cod_filial)
+    return _single_flight(chave, lambda: _query_product_options(search_term, cod_rede, cod_filial))
+
+
+def _query_product_options(search_term, cod_rede, cod_filial, cur=None):
+    """Executa no banco a busca de produtos por descrição."""
+    _incrementar_metrica('buscas_executadas')
+
     try:
-        with psycopg2.connect(**DB_CONFIG) as conn:
-            with conn.cursor() as cur:
-                SQL_BUSCA_DESCRICAO = """
-                    SELECT 
-                        t1.cod_reduzido, 
-                        t1.nom_produto,
-                        t4.vlr_liquido, 
-                        t3.qtd_estoque,
-                        t5.nom_laborat,
-                        t1.vlr_venda 
-                    FROM cadprodu t1
-                    LEFT JOIN cadestoq t3 ON t1.cod_reduzido = t3.cod_reduzido 
-                        AND t3.cod_rede = t1.cod_rede 
-                        AND t3.cod_filial = %s 
-                    LEFT JOIN desconto_produto_vw AS t4 ON t4.cod_reduzido = t1.cod_reduzido
-                    LEFT JOIN public.cadlabor t5 ON t1.cod_laborat = t5.cod_laborat
-                    WHERE t1.nom_produto ILIKE %s AND t1.cod_rede = %s
-                    ORDER BY 
-                        CASE WHEN t3.qtd_estoque > 0 THEN 0 ELSE 1 END,
-                        t1.nom_produto                                 
-                    LIMIT 10;
-                """
-                like_term = f"%{search_term}%"
-                cur.execute(sql.SQL(SQL_BUSCA_DESCRICAO), (cod_filial, like_term, cod_rede))
-                rows_descricao = cur.fetchall()
-
-                if not rows_descricao:
-                    return []
-
-                product_options = []
-                for row in rows_descricao:
-                    cod_reduzido = safe_int(row[0])
-                    nome_produto = row[1]
-                    vlr_liquido_raw = row[2]
-                    qtd_estoque_raw = row[3]
-                    nom_laboratorio = row[4]
-                    vlr_venda_raw = row[5]
-
-                    vlr_venda_float = float(vlr_venda_raw) if vlr_venda_raw is not None else 0.0
-                    vlr_liquido_float = float(vlr_liquido_raw) if vlr_liquido_raw is not None else 0.0
-                    qtd_estoque = safe_int(qtd_estoque_raw) if qtd_estoque_raw is not None else 0
-
-                    # CÁLCULO DA MENSAGEM DO WHATSAPP
-                    whatsapp_string = ""
-                    desconto_percentual = 0.0
-
-                    if vlr_venda_float > 0 and vlr_liquido_float < vlr_venda_float:
-                        desconto_percentual = ((vlr_venda_float - vlr_liquido_float) / vlr_venda_float) * 100
-
-                    desconto_str = f"{desconto_percentual:.2f}".replace('.', ',')
-                    vlr_liquido_wapp = format_whatsapp_price(vlr_liquido_float)
-                    vlr_venda_wapp = format_whatsapp_price(vlr_venda_float)
-
-                    if qtd_estoque > 0:
-                        estoque_str = f"Temos {qtd_estoque} unidades em estoque."
-                        if desconto_percentual > 0.01:
-                            whatsapp_string = (
-                                f"**{nome_produto}** está com {desconto_str}% OFF! "
-                                f"De R$ {vlr_venda_wapp} por **R$ {vlr_liquido_wapp}** à vista. "
-                                f"{estoque_str}"
-                            )
-                        else:
-                            whatsapp_string = (
-                                f"**{nome_produto}** por apenas **R$ {vlr_liquido_wapp}** à vista. "
-                                f"{estoque_str}"
-                            )
-                    else:
-                        whatsapp_string = (
-                            f"Ótima escolha! O preço final para **{nome_produto}** "
-                            f"é de **R$ {vlr_liquido_wapp}** à vista. "
-                            f"No momento, está esgotado. Gostaria de verificar a encomenda para você?"
-                        )
-
-                    product_options.append({
-                        'cod_reduzido': cod_reduzido,
-                        'nome_produto': nome_produto,
-                        'nom_laboratorio': nom_laboratorio if nom_laboratorio else 'N/A',
-                        'vlr_venda': currencyformat(vlr_venda_raw),
-                        'preco_final_venda': currencyformat(vlr_liquido_raw),
-                        'qtd_estoque': qtd_estoque,
-                        'whatsapp_string': whatsapp_string,
-                        'vlr_venda_raw_float': vlr_venda_float,
-                        'vlr_liquido_raw_float': vlr_liquido_float,
-                        'desconto_percentual': round(desconto_percentual, 2),
-                        'vlr_liquido_wapp': vlr_liquido_wapp
-                    })
+        if cur is not None:
+            return _montar_opcoes_produto(cur, search_term, cod_rede, cod_filial)
 
-                return product_options
+        with conexao_db() as conn:
+            with conn.cursor() as cur:
+                return _montar_opcoes_produto(cur, search_term, cod_rede, cod_filial)
 
     except psycopg2.Error as e:
         print(f"Erro de Banco de Dados na busca por descrição: {e}")
@@ -216,15 +637,226 @@ def _fetch_product_options(search_term, cod_rede, cod_filial):
         return None
 
 
+def _montar_opcoes_produto(cur, search_term, cod_rede, cod_filial):
+    """Consulta os produtos por descrição e monta as opções (com a mensagem do WhatsApp)."""
+    like_term = f"%{search_term}%"
+    executar_consulta(cur, SQL_BUSCA_DESCRICAO, (cod_filial, like_term, cod_rede))
+    rows_descricao = cur.fetchall()
+
+    if not rows_descricao:
+        return []
+
+    product_options = []
+    for row in rows_descricao:
+        cod_reduzido = safe_int(row[0])
+        nome_produto = row[1]
+        vlr_liquido_raw = row[2]
+        qtd_estoque_raw = row[3]
+        nom_laboratorio = row[4]
+        vlr_venda_raw = row[5]
+
+        vlr_venda_float = float(vlr_venda_raw) if vlr_venda_raw is not None else 0.0
+        vlr_liquido_float = float(vlr_liquido_raw) if vlr_liquido_raw is not None else 0.0
+        qtd_estoque = safe_int(qtd_estoque_raw) if qtd_estoque_raw is not None else 0
+
+        # CÁLCULO DA MENSAGEM DO WHATSAPP
+        whatsapp_string = ""
+        desconto_percentual = 0.0
+
+        if vlr_venda_float > 0 and vlr_liquido_float < vlr_venda_float:
+            desconto_percentual = ((vlr_venda_float - vlr_liquido_float) / vlr_venda_float) * 100
+
+        desconto_str = f"{desconto_percentual:.2f}".replace('.', ',')
+        vlr_liquido_wapp = format_whatsapp_price(vlr_liquido_float)
+        vlr_venda_wapp = format_whatsapp_price(vlr_venda_float)
+
+        if qtd_estoque > 0:
+            estoque_str = f"Temos {qtd_estoque} unidades em estoque."
+            if desconto_percentual > 0.01:
+                whatsapp_string = (
+                    f"**{nome_produto}** está com {desconto_str}% OFF! "
+                    f"De R$ {vlr_venda_wapp} por **R$ {vlr_liquido_wapp}** à vista. "
+                    f"{estoque_str}"
+                )
+            else:
+                whatsapp_string = (
+                    f"**{nome_produto}** por apenas **R$ {vlr_liquido_wapp}** à vista. "
+                    f"{estoque_str}"
+                )
+        else:
+            whatsapp_string = (
+                f"Ótima escolha! O preço final para **{nome_produto}** "
+                f"é de **R$ {vlr_liquido_wapp}** à vista. "
+                f"No momento, está esgotado. Gostaria de verificar a encomenda para você?"
+            )
+
+        product_options.append({
+            'cod_reduzido': cod_reduzido,
+            'nome_produto': nome_produto,
+            'nom_laboratorio': nom_laboratorio if nom_laboratorio else 'N/A',
+            'vlr_venda': currencyformat(vlr_venda_raw),
+            'preco_final_venda': currencyformat(vlr_liquido_raw),
+            'qtd_estoque': qtd_estoque,
+            'whatsapp_string': whatsapp_string,
+            'vlr_venda_raw_float': vlr_venda_float,
+            'vlr_liquido_raw_float': vlr_liquido_float,
+            'desconto_percentual': round(desconto_percentual, 2),
+            'vlr_liquido_wapp': vlr_liquido_wapp
+        })
+
+    return product_options
+
+
+
 # ==============================================================================
-# 4. ROTAS DA API
+# 6. ANÁLISE DE GIRO (VENDAS DIÁRIAS E SUGESTÃO DE REPOSIÇÃO)
+# ==============================================================================
+
+SQL_VENDAS_DIARIAS = registrar_consulta('vendas_diarias', """
+    SELECT cod_reduzido, cod_filial, dat_atualiza::date AS dia, SUM(qtd_produto)
+    FROM cadinfis
+    WHERE cod_rede = %s AND dat_atualiza >= %s AND dat_atualiza < %s
+    GROUP BY 1, 2, 3
+""")
+
+SQL_ESTOQUE_FILIAL = registrar_consulta('estoque_filial', """
+    SELECT t3.cod_reduzido, t1.nom_produto, t3.qtd_estoque, t3.est_minimo
+    FROM cadestoq t3
+    INNER JOIN cadprodu t1 ON t1.cod_reduzido = t3.cod_reduzido AND t1.cod_rede = t3.cod_rede
+    WHERE t3.cod_rede = %s AND t3.cod_filial = %s
+""")
+
+# (cod_reduzido, cod_filial) -> {dia: quantidade vendida}, só com dias completos (até ontem).
+# O dicionário é sempre substituído por inteiro na atualização, então leitores podem usá-lo sem lock.
+_vendas_diarias = {}
+_giro_estado = {
+    'processado_ate': None,
+    'atualizado_em': None,
+    'atualizado_em_iso': None
+}
+_giro_lock = threading.Lock()
+_giro_solicitacao = threading.Event()
+_giro_thread = None
+_giro_thread_lock = threading.Lock()
+
+
+def _atualizar_vendas_diarias(cod_rede):
+    """
+    Atualiza incrementalmente os totais diários de vendas a partir do `cadinfis`.
+    A janela termina ontem (o dia corrente ainda está incompleto). Só reagrega os dias
+    novos e o último dia já processado (que pode receber lançamentos tardios), e
+    descarta os dias que saíram da janela.
+    """
+    global _vendas_diarias
+
+    with _giro_lock:
+        fim_janela = date.today()
+        inicio_janela = fim_janela - timedelta(days=GIRO_CONFIG['janela_dias'])
+        processado_ate = _giro_estado['processado_ate']
+        desde = max(processado_ate - timedelta(days=1), inicio_janela) if processado_ate else inicio_janela
+
+        with conexao_db() as conn:
+            with conn.cursor() as cur:
+                executar_consulta(cur, SQL_VENDAS_DIARIAS, (cod_rede, desde, fim_janela))
+                rows = cur.fetchall()
+
+        novas_vendas = {}
+        for chave, serie in _vendas_diarias.items():
+            mantidos = {dia: qtd for dia, qtd in serie.items() if inicio_janela <= dia < desde}
+            if mantidos:
+                novas_vendas[chave] = mantidos
+
+        for cod_reduzido, cod_filial, dia, qtd in rows:
+            chave = (safe_int(cod_reduzido), safe_int(cod_filial))
+            novas_vendas.setdefault(chave, {})[dia] = float(qtd) if qtd is not None else 0.0
+
+        _vendas_diarias = novas_vendas
+        _giro_estado.update({
+            'processado_ate': fim_janela,
+            'atualizado_em': time.monotonic(),
+            'atualizado_em_iso': datetime.now().isoformat()
+        })
+
+
+def _laco_atualizacao_giro():
+    """Mantém os totais diários atualizados em segundo plano, a cada `intervalo_atualizacao`."""
+    while True:
+        try:
+            _atualizar_vendas_diarias(DADOS_SOLICITANTE['COD_REDE'])
+        except Exception as e:
+            print(f"Erro ao atualizar a análise de giro: {e}")
+
+        _giro_solicitacao.wait(GIRO_CONFIG['intervalo_atualizacao'])
+        _giro_solicitacao.clear()
+
+
+def iniciar_atualizacao_giro():
+    """Inicia (uma única vez) a thread que carrega e atualiza os totais diários."""
+    global _giro_thread
+    with _giro_thread_lock:
+        if _giro_thread is None:
+            _giro_thread = threading.Thread(target=_laco_atualizacao_giro, name='atualizacao-giro', daemon=True)
+            _giro_thread.start()
+
+
+def _solicitar_atualizacao_giro():
+    """
+    Pede, sem bloquear, uma atualização antecipada se os dados estiverem desatualizados.
+    Na primeira chamada do processo, inicia a thread de atualização.
+    """
+    if not GIRO_CONFIG['atualizacao_automatica']:
+        return
+
+    if _giro_thread is None:
+        iniciar_atualizacao_giro()
+        return
+
+    atualizado_em = _giro_estado['atualizado_em']
+    if atualizado_em is None or time.monotonic() - atualizado_em >= GIRO_CONFIG['intervalo_atualizacao']:
+        _giro_solicitacao.set()
+
+
+def _calcular_giro(serie, qtd_estoque, est_minimo):
+    """Calcula média diária, dias de cobertura e sugestão de compra para um produto."""
+    total_vendido = sum(serie.values()) if serie else 0.0
+    media_diaria = total_vendido / GIRO_CONFIG['janela_dias']
+    estoque = safe_int(qtd_estoque) or 0
+    minimo = safe_int(est_minimo) or 0
+
+    dias_cobertura = None
+    dias_ate_minimo = None
+    if media_diaria > 0:
+        dias_cobertura = round(estoque / media_diaria, 1)
+        dias_ate_minimo = round((estoque - minimo) / media_diaria, 1)
+
+    precisa_repor = estoque <= minimo or (
+        dias_ate_minimo is not None and dias_ate_minimo <= GIRO_CONFIG['prazo_reposicao_dias'])
+
+    sugestao_compra = 0
+    if precisa_repor:
+        dias_alvo = GIRO_CONFIG['prazo_reposicao_dias'] + GIRO_CONFIG['dias_cobertura_alvo']
+        sugestao_compra = max(0, math.ceil(minimo + media_diaria * dias_alvo - estoque))
+
+    return {
+        'qtd_vendida_janela': safe_int(total_vendido),
+        'media_diaria': round(media_diaria, 2),
+        'dias_cobertura': dias_cobertura,
+        'dias_ate_minimo': dias_ate_minimo,
+        'sugestao_compra': sugestao_compra
+    }
+
+
+# ==============================================================================
+# 7. ROTAS DA API
 # ==============================================================================
 
 @app.route('/api/status', methods=['GET'])
 def api_status():
     """Endpoint para verificar o status da API."""
     try:
-        with psycopg2.connect(**DB_CONFIG) as conn:
+        with conexao_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
             db_status = "online"
 
         return jsonify({
@@ -241,7 +873,32 @@ def api_status():
         }), 500
 
 
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    """Exporta os contadores de busca, de limite de requisições e das consultas ao banco."""
+    with _metricas_lock:
+        contadores = dict(METRICAS)
+    with _baldes_lock:
+        clientes_ativos = len(_baldes_clientes)
+    with _buscas_lock:
+        buscas_em_andamento = len(_buscas_em_andamento)
+
+    return jsonify({
+        "counters": contadores,
+        "rate_limit": {
+            "requisicoes_por_segundo": RATE_LIMIT_CONFIG['requisicoes_por_segundo'],
+            "rajada": RATE_LIMIT_CONFIG['rajada'],
+            "clientes_ativos": clientes_ativos
+        },
+        "buscas_em_andamento": buscas_em_andamento,
+        "consultas_preparadas": DB_POOL_CONFIG['consultas_preparadas'],
+        "consultas": resumo_estatisticas_consultas(),
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
+
 @app.route('/api/products/search', methods=['GET'])
+@rate_limited
 def api_products_search():
     """API para busca de produtos (live search)."""
     search_term = request.args.get('q', '')
@@ -280,11 +937,84 @@ def api_products_search():
         }), 500
 
 
+@app.route('/api/analytics/reposicao', methods=['GET'])
+def api_sugestao_reposicao():
+    """Giro de vendas, dias de cobertura e sugestão de reposição de toda a filial."""
+    cod_rede = DADOS_SOLICITANTE['COD_REDE']
+    cod_filial = request.args.get('filial', DADOS_SOLICITANTE['COD_FILIAL'], type=int)
+    incluir_todos = request.args.get('todos') == '1'
+
+    if not GIRO_CONFIG['atualizacao_automatica']:
+        return jsonify({
+            "success": False,
+            "error": "Análise de giro desativada (GIRO_ATUALIZACAO_AUTOMATICA=false)."
+        }), 501
+
+    _solicitar_atualizacao_giro()
+    if _giro_estado['atualizado_em'] is None:
+        response = jsonify({
+            "success": False,
+            "error": "Análise de giro em carregamento. Tente novamente em instantes."
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+
+    try:
+        with conexao_db() as conn:
+            with conn.cursor() as cur:
+                executar_consulta(cur, SQL_ESTOQUE_FILIAL, (cod_rede, cod_filial))
+                rows_estoque = cur.fetchall()
+
+        vendas_diarias = _vendas_diarias
+        itens = []
+        for cod_reduzido, nom_produto, qtd_estoque, est_minimo in rows_estoque:
+            cod_reduzido = safe_int(cod_reduzido)
+            giro = _calcular_giro(vendas_diarias.get((cod_reduzido, cod_filial)), qtd_estoque, est_minimo)
+
+            if not incluir_todos and giro['sugestao_compra'] <= 0:
+                continue
+
+            itens.append({
+                'cod_reduzido': cod_reduzido,
+                'nome_produto': nom_produto,
+                'qtd_estoque': safe_int(qtd_estoque) or 0,
+                'est_minimo': safe_int(est_minimo) or 0,
+                **giro
+            })
+
+        # Itens com menor cobertura primeiro; produtos sem venda na janela ficam no fim
+        itens.sort(key=lambda item: (item['dias_cobertura'] is None, item['dias_cobertura'] or 0))
+
+        return jsonify({
+            "success": True,
+            "cod_filial": cod_filial,
+            "janela_dias": GIRO_CONFIG['janela_dias'],
+            "atualizado_em": _giro_estado['atualizado_em_iso'],
+            "count": len(itens),
+            "data": itens
+        }), 200
+
+    except psycopg2.Error as e:
+        print(f"Erro de Banco de Dados na análise de giro: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Erro ao consultar o banco de dados"
+        }), 500
+    except Exception as e:
+        print(f"Erro inesperado na análise de giro: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Erro na análise de giro"
+        }), 500
+
+
 # ==============================================================================
-# 5. ROTAS PRINCIPAIS
+# 8. ROTAS PRINCIPAIS
 # ==============================================================================
 
 @app.route('/search_live', methods=['GET'])
+@rate_limited
 def search_live():
     """Rota para Live Search (AJAX)."""
     search_term = request.args.get('search_term', '')
@@ -332,18 +1062,12 @@ def get_product_info():
     product_options = None
 
     try:
-        with psycopg2.connect(**DB_CONFIG) as conn:
+        with conexao_db() as conn:
             with conn.cursor() as cur:
                 # BUSCA POR CÓDIGO NUMÉRICO (EAN OU REDUZIDO)
                 if is_numeric:
                     if len(search_term) > 8:
-                        SQL_BUSCA = """
-                            SELECT cod_reduzido, cod_barra
-                            FROM cadcdbar
-                            WHERE cod_barra = %s
-                            LIMIT 1;
-                        """
-                        cur.execute(sql.SQL(SQL_BUSCA), (search_term,))
+                        executar_consulta(cur, SQL_BUSCA_EAN, (search_term,))
                         row_found = cur.fetchone()
 
                         if row_found:
@@ -352,14 +1076,7 @@ def get_product_info():
                             context['ean_code'] = ean_found
 
                     if not cod_reduzido and len(search_term) <= 8:
-                        SQL_BUSCA_REDUZIDO = """
-                            SELECT t1.cod_reduzido, t2.cod_barra
-                            FROM cadprodu t1
-                            LEFT JOIN cadcdbar t2 ON t1.cod_reduzido = t2.cod_reduzido
-                            WHERE t1.cod_reduzido = %s AND t1.cod_rede = %s
-                            LIMIT 1;
-                        """
-                        cur.execute(sql.SQL(SQL_BUSCA_REDUZIDO), (search_term, cod_rede))
+                        executar_consulta(cur, SQL_BUSCA_REDUZIDO, (search_term, cod_rede))
                         row_reduzido = cur.fetchone()
 
                         if row_reduzido:
@@ -367,13 +1084,7 @@ def get_product_info():
                             ean_found = row_reduzido[1]
                             context['ean_code'] = ean_found or "Não cadastrado"
                         else:
-                            SQL_BUSCA_EAN = """
-                                SELECT cod_reduzido, cod_barra
-                                FROM cadcdbar
-                                WHERE cod_barra = %s
-                                LIMIT 1;
-                            """
-                            cur.execute(sql.SQL(SQL_BUSCA_EAN), (search_term,))
+                            executar_consulta(cur, SQL_BUSCA_EAN, (search_term,))
                             row_ean = cur.fetchone()
 
                             if row_ean:
@@ -383,7 +1094,7 @@ def get_product_info():
 
                 # BUSCA POR DESCRIÇÃO
                 if not cod_reduzido:
-                    options = _fetch_product_options(search_term, cod_rede, cod_filial)
+                    options = _fetch_product_options(search_term, cod_rede, cod_filial, cur)
 
                     if options is None:
                         return render_template('error.html',
@@ -409,18 +1120,7 @@ def get_product_info():
                     return render_template('produto.html', nome_produto=None, **context)
 
                 # CONSULTA DE DADOS COMPLETOS DO PRODUTO
-                SQL_PRODUTO_FULL = """
-                    SELECT
-                        t2.nom_local, t2.vlr_venda, t2.nom_produto,
-                        t3.qtd_estoque, t3.est_minimo, t4.vlr_liquido,
-                        t5.nom_laborat
-                    FROM cadprodu t2
-                    LEFT JOIN cadestoq t3 ON t2.cod_reduzido = t3.cod_reduzido AND t3.cod_rede = %s AND t3.cod_filial = %s
-                    LEFT JOIN desconto_produto_vw AS t4 ON t4.cod_reduzido = t2.cod_reduzido
-                    LEFT JOIN public.cadlabor t5 ON t2.cod_laborat = t5.cod_laborat 
-                    WHERE t2.cod_reduzido = %s AND t2.cod_rede = %s
-                """
-                cur.execute(sql.SQL(SQL_PRODUTO_FULL), (cod_rede, cod_filial, cod_reduzido, cod_rede))
+                executar_consulta(cur, SQL_PRODUTO_FULL, (cod_rede, cod_filial, cod_reduzido, cod_rede))
                 row = cur.fetchone()
 
                 if row is None:
@@ -429,36 +1129,20 @@ def get_product_info():
                 localizacao, valor_venda, nome_produto, quantidade_em_estoque, estoque_minimo, preco_final_venda, nom_laboratorio = row
                 nom_laboratorio = nom_laboratorio if nom_laboratorio else "Não cadastrado"
 
+                # GIRO DE VENDAS (atualizado em segundo plano; aqui apenas solicita se estiver velho)
+                _solicitar_atualizacao_giro()
+                giro = None
+                if _giro_estado['atualizado_em'] is not None:
+                    giro = _calcular_giro(_vendas_diarias.get((safe_int(cod_reduzido), cod_filial)),
+                                          quantidade_em_estoque, estoque_minimo)
+
                 # CONSULTA DE ÚLTIMA VENDA
-                SQL_ULTIMA_VENDA = """
-                    SELECT dat_atualiza
-                    FROM cadinfis
-                    WHERE cod_reduzido = %s AND cod_rede = %s AND cod_filial = %s
-                    ORDER BY dat_atualiza DESC
-                    LIMIT 1
-                """
-                cur.execute(sql.SQL(SQL_ULTIMA_VENDA), (cod_reduzido, cod_rede, cod_filial))
+                executar_consulta(cur, SQL_ULTIMA_VENDA, (cod_reduzido, cod_rede, cod_filial))
                 ultima_venda_db = cur.fetchone()
                 ultima_compra = ultima_venda_db[0] if ultima_venda_db else None
 
                 # CONSULTA DE ÚLTIMAS ENTRADAS
-                SQL_LOTES_ENTRADAS = """
-                SELECT 
-                    t1.dat_entrada, t1.qtd_produto, t2.num_lote, t3.dat_fabric, 
-                    t3.dat_valid, t3.qtd_saldo, t1.cod_fornec, t1.num_nota,
-                    t4.nom_fornec 
-                FROM public.cadicomp t1
-                INNER JOIN public.cadlentd t2 ON t2.cod_reduzido = t1.cod_reduzido 
-                    AND t2.num_nota = t1.num_nota 
-                    AND t2.cod_rede = t1.cod_rede 
-                    AND t2.cod_filial = t1.cod_filial
-                LEFT JOIN public.cadloted t3 ON t3.num_lote = t2.num_lote
-                LEFT JOIN public.cadforne t4 ON t4.cod_fornec = t1.cod_fornec AND t4.cod_rede = t1.cod_rede 
-                WHERE t1.cod_reduzido = %s AND t1.cod_rede = %s AND t1.cod_filial = %s
-                ORDER BY t1.dat_entrada DESC, t1.num_nota DESC, t1.cod_fornec DESC
-                LIMIT 3;
-                """
-                cur.execute(sql.SQL(SQL_LOTES_ENTRADAS), (cod_reduzido, cod_rede, cod_filial))
+                executar_consulta(cur, SQL_LOTES_ENTRADAS, (cod_reduzido, cod_rede, cod_filial))
                 lotes_entradas_db = cur.fetchall()
 
                 # PROCESSAMENTO DAS ENTRADAS
@@ -508,27 +1192,7 @@ def get_product_info():
                     estoque_anterior_entrada = "N/A"
 
                 # CONSULTA DE ÚLTIMAS VENDAS
-                SQL_ULTIMAS_VENDAS = """
-                    SELECT
-                        t1.dat_atualiza, t1.qtd_produto, (t1.vlr_total / t1.qtd_produto) AS vlr_unitario_final, 
-                        STRING_AGG(t6.num_lote || ' (' || t6.qtd_lote || ')', ', ') AS lotes_vendidos,
-                        t3.nom_usuario, t4.nom_cliente, t1.num_nota, t1.num_sequencial
-                    FROM cadinfis t1
-                    INNER JOIN public.cadcnfis t2 ON t2.num_nota = t1.num_nota
-                        AND t2.cod_rede = t1.cod_rede AND t2.cod_filial = t1.cod_filial
-                    LEFT JOIN public.cadcvend t5 ON t5.cod_rede = t2.cod_rede 
-                        AND t5.cod_filial = t2.cod_filial AND t5.num_nota = t2.num_controle
-                    LEFT JOIN public.cadusuar t3 ON t3.cod_usuario = t5.cod_vendedor
-                    LEFT JOIN public.cadclien t4 ON t4.cod_cliente = t2.cod_cliente
-                    LEFT JOIN public.cadlvend t6 ON t6.cod_rede = t1.cod_rede
-                        AND t6.cod_filial = t1.cod_filial AND t6.num_nota = t2.num_controle
-                        AND t6.num_seqcadivend = t1.num_sequencial
-                    WHERE t1.cod_reduzido = %s AND t1.cod_rede = %s AND t1.cod_filial = %s
-                    GROUP BY 1, 2, 3, 5, 6, 7, 8
-                    ORDER BY t1.dat_atualiza DESC, t1.num_nota DESC, t1.num_sequencial DESC
-                    LIMIT 3
-                """
-                cur.execute(sql.SQL(SQL_ULTIMAS_VENDAS), (cod_reduzido, cod_rede, cod_filial))
+                executar_consulta(cur, SQL_ULTIMAS_VENDAS, (cod_reduzido, cod_rede, cod_filial))
                 ultimas_vendas_db = cur.fetchall()
 
                 # PROCESSAMENTO DAS VENDAS
@@ -576,6 +1240,8 @@ def get_product_info():
         'ultimas_vendas': vendas_formatadas,
         'estoque_anterior_entrada': estoque_anterior_entrada,
         'data_penultima_entrada': data_penultima_entrada,
+        'giro': giro,
+        'giro_atualizado_em': _giro_estado['atualizado_em_iso'],
         'product_options': None
     })
 
@@ -615,17 +1281,9 @@ def gerar_carta_correcao():
 
         if num_nota and cod_fornec:
             try:
-                with psycopg2.connect(**DB_CONFIG) as conn:
+                with conexao_db() as conn:
                     with conn.cursor() as cur:
-                        SQL_NF_FORNEC = """
-                        SELECT t2.nom_fornec, t2.num_cnpj, t1.dat_emissao, t1.nom_chavenfe
-                        FROM public.cadccomp t1
-                        INNER JOIN public.cadforne t2 ON t1.cod_fornec = t2.cod_fornec AND t1.cod_rede = t2.cod_rede
-                        WHERE t1.num_nota = %s AND t1.cod_fornec = %s AND t1.cod_rede = %s AND t1.cod_filial = %s
-                        ORDER BY t1.dat_emissao DESC
-                        LIMIT 1;
-                        """
-                        cur.execute(sql.SQL(SQL_NF_FORNEC), (num_nota, cod_fornec, cod_rede, cod_filial))
+                        executar_consulta(cur, SQL_NF_FORNEC, (num_nota, cod_fornec, cod_rede, cod_filial))
                         row_nf_fornec = cur.fetchone()
 
                         if row_nf_fornec:
@@ -679,17 +1337,9 @@ def gerar_carta_correcao():
 
         if num_nota and cod_fornec:
             try:
-                with psycopg2.connect(**DB_CONFIG) as conn:
+                with conexao_db() as conn:
                     with conn.cursor() as cur:
-                        SQL_NF_FORNEC = """
-                        SELECT t2.nom_fornec, t2.num_cnpj, t1.dat_emissao, t1.nom_chavenfe
-                        FROM public.cadccomp t1
-                        INNER JOIN public.cadforne t2 ON t1.cod_fornec = t2.cod_fornec AND t1.cod_rede = t2.cod_rede
-                        WHERE t1.num_nota = %s AND t1.cod_fornec = %s AND t1.cod_rede = %s AND t1.cod_filial = %s
-                        ORDER BY t1.dat_emissao DESC
-                        LIMIT 1;
-                        """
-                        cur.execute(sql.SQL(SQL_NF_FORNEC), (num_nota, cod_fornec, cod_rede, cod_filial))
+                        executar_consulta(cur, SQL_NF_FORNEC, (num_nota, cod_fornec, cod_rede, cod_filial))
                         row_nf_fornec = cur.fetchone()
 
                         if row_nf_fornec:
@@ -713,4 +1363,7 @@ def gerar_carta_correcao():
 
 
 if __name__ == '__main__':
+    # Com o reloader do modo debug, só o processo filho (WERKZEUG_RUN_MAIN) atende requisições
+    if GIRO_CONFIG['atualizacao_automatica'] and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        iniciar_atualizacao_giro()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file